@@ -1,20 +1,52 @@
-from fastapi import FastAPI, HTTPException, Body, Query, Request
+from fastapi import FastAPI, HTTPException, Body, Query, Request, Response
 from fastapi.exceptions import RequestValidationError
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-from pydantic import BaseModel, Field, EmailStr
-from typing import List, Optional
+from pymongo import AsyncMongoClient, ReturnDocument
+from pydantic import BaseModel, ConfigDict, Field, EmailStr
+from typing import List, Literal, Optional
 from enum import Enum
-from datetime import datetime
+from datetime import datetime, timezone
 from bson import ObjectId
+from bson.errors import InvalidId
+from collections import OrderedDict
+import hashlib
+import orjson
 import os
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI(title="He-Ara API")
+# --- Serialization ---
+
+def _orjson_default(obj):
+    """
+    Fallback encoder for types orjson does not handle natively.
+    """
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def dumps(content) -> bytes:
+    """
+    Serialize content to JSON bytes with orjson.
+    """
+    return orjson.dumps(
+        content,
+        default=_orjson_default,
+        option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+    )
+
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson instead of the stdlib json module.
+    """
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+app = FastAPI(title="He-Ara API", default_response_class=ORJSONResponse)
 
 # --- Error Handling ---
 @app.exception_handler(RequestValidationError)
@@ -22,8 +54,8 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
     """
     Custom handler to provide clear error messages for validation failures.
     """
-    errors = [f"{err['loc'][-1]}: {err['msg']}" for err in exc.errors()]
-    return JSONResponse(
+    errors = tuple(f"{err['loc'][-1]}: {err['msg']}" for err in exc.errors())
+    return ORJSONResponse(
         status_code=422,
         content={"detail": "Validation Error", "errors": errors}
     )
@@ -35,20 +67,123 @@ origins = [
     "http://127.0.0.1:5500",
 ]
 
+# In development any origin is allowed; browsers forbid "*" with credentials
+ALLOW_ALL_ORIGINS = os.getenv("ENV") == "dev"
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=origins,
-    allow_origin_regex=".*",  # Allow all origins for development with credentials
-    allow_credentials=True,
+    allow_origins=["*"] if ALLOW_ALL_ORIGINS else origins,
+    allow_credentials=not ALLOW_ALL_ORIGINS,
     allow_methods=["*"],
     allow_headers=["*"],
 )
 
 # --- Database Connection ---
 MONGO_URL = os.getenv("MONGO_URL", "mongodb://localhost:27017")
-client = AsyncIOMotorClient(MONGO_URL)
+# Keep a warm pool for bursts of list requests and compress wire traffic
+client = AsyncMongoClient(
+    MONGO_URL,
+    maxPoolSize=200,
+    minPoolSize=20,
+    compressors="zstd,snappy",
+    retryWrites=True,
+    w=1,
+    tz_aware=True,  # Return stored dates as UTC-aware, like the ones we write
+)
 db = client.heara_db
 
+@app.on_event("startup")
+async def warm_up_connection_pool():
+    """
+    Open the first connection before serving so requests do not pay for it.
+    """
+    await db.command("ping")
+
+@app.on_event("startup")
+async def create_indexes():
+    """
+    Ensure the indexes backing the lead filters and product lookups exist.
+    """
+    await db.leads.create_index([("status", 1), ("createdAt", -1)])
+    await db.products.create_index([("id", 1)], unique=True)
+
+# Fields returned by the lead list endpoint; ids are stringified server-side
+LEAD_PROJECTION = {
+    "_id": {"$toString": "$_id"},
+    "id": {"$toString": "$_id"},
+    "name": 1,
+    "phone": 1,
+    "email": 1,
+    "message": 1,
+    "source": 1,
+    "productInterest": 1,
+    "status": 1,
+    "createdAt": 1,
+    "updatedAt": 1,
+}
+
+# --- Product Cache ---
+# Product data rarely changes, so serialized responses are kept in-process
+PRODUCT_CACHE_TTL = 60  # seconds
+_product_cache = {}  # product id ("" for the full list) -> (expires_at, bytes)
+
+def _get_cached_product(key: str) -> Optional[bytes]:
+    entry = _product_cache.get(key)
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return entry[1]
+
+def _cache_product(key: str, content) -> bytes:
+    body = dumps(content)
+    _product_cache[key] = (time.monotonic() + PRODUCT_CACHE_TTL, body)
+    return body
+
+# --- Lead Cache ---
+# Serialized single-lead responses, evicted least-recently-used. Updates drop
+# the entry in this process; the TTL bounds staleness across workers.
+LEAD_CACHE_SIZE = 1024
+LEAD_CACHE_TTL = 30  # seconds
+_lead_cache = OrderedDict()  # lead id -> (expires_at, bytes, etag)
+# Bumped on every invalidation so a fetch that raced an update is not cached
+_lead_cache_version = 0
+
+def _get_cached_lead(key: str):
+    entry = _lead_cache.get(key)
+    if entry is None:
+        return None
+    if entry[0] < time.monotonic():
+        del _lead_cache[key]
+        return None
+    _lead_cache.move_to_end(key)
+    return entry
+
+def _serialize_lead(content):
+    body = dumps(content)
+    return body, '"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+def _cache_lead(key: str, body: bytes, etag: str):
+    _lead_cache[key] = (time.monotonic() + LEAD_CACHE_TTL, body, etag)
+    _lead_cache.move_to_end(key)
+    if len(_lead_cache) > LEAD_CACHE_SIZE:
+        _lead_cache.popitem(last=False)
+
+def _invalidate_lead(key: str):
+    global _lead_cache_version
+    _lead_cache_version += 1
+    _lead_cache.pop(key, None)
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison of an If-None-Match header against an ETag.
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
 # --- Models ---
 
 class LeadStatus(str, Enum):
@@ -57,6 +192,9 @@ class LeadStatus(str, Enum):
     CONVERTED = "converted"
     CLOSED = "closed"
 
+# Validated as a plain literal on the models; the enum remains for query params
+LeadStatusValue = Literal["new", "contacted", "converted", "closed"]
+
 class LeadModel(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
     name: str = Field(..., min_length=2)
@@ -65,14 +203,13 @@ class LeadModel(BaseModel):
     message: Optional[str] = None
     source: str = "website"
     productInterest: Optional[str] = None
-    status: LeadStatus = LeadStatus.NEW
-    createdAt: datetime = Field(default_factory=datetime.utcnow)
-    updatedAt: datetime = Field(default_factory=datetime.utcnow)
-
-    class Config:
-        allow_population_by_field_name = True
-        json_encoders = {ObjectId: str}
-        schema_extra = {
+    status: LeadStatusValue = "new"
+    createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+    updatedAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
+
+    model_config = ConfigDict(
+        populate_by_name=True,
+        json_schema_extra={
             "example": {
                 "name": "Israel Israeli",
                 "phone": "050-1234567",
@@ -82,7 +219,8 @@ class LeadModel(BaseModel):
                 "productInterest": "mark-1",
                 "status": "new"
             }
-        }
+        },
+    )
 
 class LeadUpdateModel(BaseModel):
     name: Optional[str] = None
@@ -91,7 +229,7 @@ class LeadUpdateModel(BaseModel):
     message: Optional[str] = None
     source: Optional[str] = None
     productInterest: Optional[str] = None
-    status: Optional[LeadStatus] = None
+    status: Optional[LeadStatusValue] = None
 
 class ProductModel(BaseModel):
     id: str
@@ -104,7 +242,20 @@ class ProductModel(BaseModel):
     imageUrl: str
     inStock: bool
 
+# --- Helpers ---
+
+def parse_object_id(id: str) -> ObjectId:
+    """
+    Parse a lead id, rejecting malformed values with a 400.
+    """
+    try:
+        return ObjectId(id)
+    except InvalidId:
+        raise HTTPException(status_code=400, detail="Invalid ID format")
+
 # --- Routes ---
+# response_model only documents the schema: the handlers return Response
+# objects, which FastAPI sends without validating or re-encoding them.
 
 @app.get("/")
 async def read_root():
@@ -113,27 +264,29 @@ async def read_root():
 # Leads Endpoints
 
 @app.post("/api/leads", response_model=LeadModel, status_code=201)
-async def create_lead(lead: LeadModel = Body(...)):
-    new_lead = lead.dict()
-    if "id" in new_lead:
-        del new_lead["id"]
-    
-    new_lead["createdAt"] = datetime.utcnow()
-    new_lead["updatedAt"] = datetime.utcnow()
-    
+async def create_lead(lead: LeadModel = Body(...)) -> Response:
+    # Timestamps are set below, so skip dumping them along with the id
+    new_lead = lead.model_dump(
+        mode="json", by_alias=False, exclude={"id", "createdAt", "updatedAt"}
+    )
+
+    # BSON dates hold milliseconds; truncate so the response matches later reads
+    now = datetime.now(timezone.utc)
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+    new_lead["createdAt"] = new_lead["updatedAt"] = now
+
     result = await db.leads.insert_one(new_lead)
-    created_lead = await db.leads.find_one({"_id": result.inserted_id})
-    # Map _id to id for response
-    created_lead["id"] = str(created_lead["_id"])
-    created_lead["_id"] = str(created_lead["_id"])
-    return created_lead
+    # The inserted document is already in hand; map _id to id for response
+    new_lead["id"] = new_lead["_id"] = str(result.inserted_id)
+    return ORJSONResponse(new_lead, status_code=201)
 
 @app.get("/api/leads", response_model=List[LeadModel])
 async def get_leads(
     status: Optional[LeadStatus] = None,
     start_date: Optional[datetime] = None,
-    end_date: Optional[datetime] = None
-):
+    end_date: Optional[datetime] = None,
+    limit: int = Query(1000, ge=1, le=1000)
+) -> Response:
     query = {}
     if status:
         query["status"] = status.value
@@ -143,60 +296,101 @@ async def get_leads(
         if start_date: query["createdAt"]["$gte"] = start_date
         if end_date: query["createdAt"]["$lte"] = end_date
     
-    leads = await db.leads.find(query).to_list(1000)
-    # Convert ObjectId to string for Pydantic
-    for lead in leads:
-        lead["id"] = str(lead["_id"])
-        lead["_id"] = str(lead["_id"])
-    return leads
+    cursor = await db.leads.aggregate([
+        {"$match": query},
+        {"$limit": limit},
+        {"$project": LEAD_PROJECTION},
+    ])
+
+    async def stream_leads():
+        # Emit a JSON array one document at a time instead of buffering the list
+        try:
+            yield b"["
+            first = True
+            async for lead in cursor:
+                if first:
+                    first = False
+                    yield dumps(lead)
+                else:
+                    yield b"," + dumps(lead)
+            yield b"]"
+        finally:
+            # Release the server-side cursor if the client disconnects early
+            await cursor.close()
+
+    return StreamingResponse(stream_leads(), media_type="application/json")
 
 @app.get("/api/leads/{id}", response_model=LeadModel)
-async def get_lead(id: str):
-    if not ObjectId.is_valid(id):
-        raise HTTPException(status_code=400, detail="Invalid ID format")
-    
-    lead = await db.leads.find_one({"_id": ObjectId(id)})
-    if lead is None:
-        raise HTTPException(status_code=404, detail="Lead not found")
-    
-    lead["id"] = str(lead["_id"])
-    lead["_id"] = str(lead["_id"])
-    return lead
+async def get_lead(id: str, request: Request) -> Response:
+    oid = parse_object_id(id)
+    key = str(oid)
+
+    entry = _get_cached_lead(key)
+    if entry is None:
+        version = _lead_cache_version
+        lead = await db.leads.find_one({"_id": oid})
+        if lead is None:
+            raise HTTPException(status_code=404, detail="Lead not found")
+
+        lead["id"] = lead["_id"] = key
+        body, etag = _serialize_lead(lead)
+        # An update that landed while fetching may postdate this copy
+        if version == _lead_cache_version:
+            _cache_lead(key, body, etag)
+    else:
+        _, body, etag = entry
+
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(content=body, media_type="application/json", headers={"ETag": etag})
 
 @app.patch("/api/leads/{id}", response_model=LeadModel)
-async def update_lead(id: str, lead_update: LeadUpdateModel = Body(...)):
-    if not ObjectId.is_valid(id):
-        raise HTTPException(status_code=400, detail="Invalid ID format")
+async def update_lead(id: str, lead_update: LeadUpdateModel = Body(...)) -> Response:
+    oid = parse_object_id(id)
+
+    update_data = lead_update.model_dump(mode="json", exclude_unset=True)
 
-    update_data = lead_update.dict(exclude_unset=True)
-    
     if len(update_data) >= 1:
-        update_data["updatedAt"] = datetime.utcnow()
-        update_result = await db.leads.update_one(
-            {"_id": ObjectId(id)}, 
-            {"$set": update_data}
+        # Let the server stamp updatedAt and hand back the post-image in one trip
+        updated_lead = await db.leads.find_one_and_update(
+            {"_id": oid},
+            {"$set": update_data, "$currentDate": {"updatedAt": True}},
+            return_document=ReturnDocument.AFTER,
         )
-        
-        if update_result.modified_count == 0:
-             # Check if lead exists if nothing was modified
-             if (await db.leads.count_documents({"_id": ObjectId(id)})) == 0:
-                raise HTTPException(status_code=404, detail="Lead not found")
+    else:
+        updated_lead = await db.leads.find_one({"_id": oid})
+
+    if updated_lead is None:
+        raise HTTPException(status_code=404, detail="Lead not found")
 
-    updated_lead = await db.leads.find_one({"_id": ObjectId(id)})
-    updated_lead["id"] = str(updated_lead["_id"])
-    updated_lead["_id"] = str(updated_lead["_id"])
-    return updated_lead
+    updated_lead["id"] = updated_lead["_id"] = str(updated_lead["_id"])
+    _invalidate_lead(updated_lead["id"])
+    return ORJSONResponse(updated_lead)
 
 # Products Endpoints
 
 @app.get("/api/products", response_model=List[ProductModel])
-async def get_products():
-    products = await db.products.find().to_list(100)
-    return products
+async def get_products() -> Response:
+    body = _get_cached_product("")
+    if body is None:
+        # Products are keyed by their own "id"; leave Mongo's _id out of the payload
+        products = await db.products.find({}, {"_id": 0}).to_list(100)
+        body = _cache_product("", products)
+    return Response(content=body, media_type="application/json")
 
 @app.get("/api/products/{id}", response_model=ProductModel)
-async def get_product(id: str):
-    product = await db.products.find_one({"id": id})
-    if product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    return product
\ No newline at end of file
+async def get_product(id: str) -> Response:
+    body = _get_cached_product(id)
+    if body is None:
+        product = await db.products.find_one({"id": id}, {"_id": 0})
+        if product is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        body = _cache_product(id, product)
+    return Response(content=body, media_type="application/json")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    # "auto" picks uvloop and httptools when they are installed
+    uvicorn.run("main:app", loop="auto", http="auto")